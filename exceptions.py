@@ -8,3 +8,9 @@ class TelegramError(Exception):
 
 class APIResponseError(Exception):
     pass
+
+
+class TooManyRequestsError(APIResponseError):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
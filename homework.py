@@ -1,16 +1,24 @@
+import json
 import logging
 import os
 import sys
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from http import HTTPStatus
+from types import MappingProxyType
 
 import requests
 from dotenv import load_dotenv
 from telebot import TeleBot
-from telebot.apihelper import ApiException
+from telebot.apihelper import ApiException, ApiTelegramException
 
-from exceptions import MissingTokenError, TelegramError, APIResponseError
+from exceptions import (
+    MissingTokenError,
+    TelegramError,
+    APIResponseError,
+    TooManyRequestsError,
+)
 
 
 load_dotenv()
@@ -18,30 +26,23 @@ load_dotenv()
 PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
-TOKENS = {
-    'PRACTICUM_TOKEN': PRACTICUM_TOKEN,
-    'TELEGRAM_TOKEN': TELEGRAM_TOKEN,
-    'TELEGRAM_CHAT_ID': TELEGRAM_CHAT_ID,
-}
+STATE_FILE = os.getenv('STATE_FILE', 'homework_state.json')
+TOKENS = ('PRACTICUM_TOKEN', 'TELEGRAM_TOKEN', 'TELEGRAM_CHAT_ID')
 
 RETRY_PERIOD = 600
+MAX_STALE_PERIOD = 3600
+ERROR_TTL = 3600
+MAX_RECENT_ERRORS = 32
 ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
-HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
+HEADERS = MappingProxyType({'Authorization': f'OAuth {PRACTICUM_TOKEN}'})
+REQUEST_TIMEOUT = (5, 30)
+MESSAGE_MAX_LENGTH = 4096
+MESSAGE_INTERVAL = 1
 
 DAYS = 7
-now = datetime.now()
-timestamp = int((now - timedelta(days=DAYS)).timestamp())
-PAYLOAD = {'from_date': timestamp}
 
-RESPONSE_KEYS = ['current_date', 'homeworks']
-HOMEWORK_KEYS = [
-    'date_updated',
-    'homework_name',
-    'id',
-    'lesson_name',
-    'reviewer_comment',
-    'status',
-]
+RESPONSE_KEYS = ('current_date', 'homeworks')
+HOMEWORK_KEYS = ('homework_name', 'status')
 
 
 HOMEWORK_VERDICTS = {
@@ -49,14 +50,29 @@ HOMEWORK_VERDICTS = {
     'reviewing': 'Работа взята на проверку ревьюером.',
     'rejected': 'Работа проверена: у ревьюера есть замечания.'
 }
+STATUS_TEMPLATES = {
+    status: f'Изменился статус проверки работы "%s". {verdict}'
+    for status, verdict in HOMEWORK_VERDICTS.items()
+}
 
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-handler = logging.StreamHandler(sys.stdout)
-formatter = logging.Formatter(
-    '%(asctime)s, %(levelname)s, %(message)s'
-)
+
+
+def setup_logging():
+    """
+    Configures the bot logger.
+    Attaches a handler writing to stdout in the bot's log format. Repeated
+    calls do not add duplicate handlers.
+    """
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s, %(levelname)s, %(message)s'
+    ))
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
 
 
 def check_tokens():
@@ -67,12 +83,7 @@ def check_tokens():
     the program to work. If at least one environment variable is missing,
     there is no point in continuing the bot's work.
     """
-    TOKENS = {
-        'PRACTICUM_TOKEN': PRACTICUM_TOKEN,
-        'TELEGRAM_TOKEN': TELEGRAM_TOKEN,
-        'TELEGRAM_CHAT_ID': TELEGRAM_CHAT_ID,
-    }
-    missing_tokens = [key for key, value in TOKENS.items() if not value]
+    missing_tokens = [name for name in TOKENS if not globals()[name]]
     if missing_tokens:
         raise MissingTokenError(
             f'Отсутствуют переменные окружения: {", ".join(missing_tokens)}'
@@ -80,6 +91,28 @@ def check_tokens():
     return True
 
 
+def post_message(bot, message):
+    """
+    Posts the message to the Telegram chat, respecting flood control.
+    If Telegram rejects the request with code 429, the message is sent once
+    more after the retry_after delay given in the response.
+    """
+    try:
+        bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
+    except ApiTelegramException as error:
+        if error.error_code != HTTPStatus.TOO_MANY_REQUESTS:
+            raise
+        retry_after = error.result_json.get('parameters', {}).get(
+            'retry_after', MESSAGE_INTERVAL
+        )
+        logger.warning(
+            'Telegram ограничил частоту отправки, повтор через %s с',
+            retry_after
+        )
+        time.sleep(retry_after)
+        bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
+
+
 def send_message(bot, message):
     """
     Sends messages to the Telegram chat.
@@ -88,12 +121,12 @@ def send_message(bot, message):
     with the message text.
     """
     try:
-        bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
+        post_message(bot, message)
     except (ApiException, requests.RequestException) as error:
         raise TelegramError(
             f'Сбой при отправке сообщения: {error}'
         )
-    logger.debug(f'Бот отправил сообщение "{message}"')
+    logger.debug('Бот отправил сообщение "%s"', message)
     return True
 
 
@@ -107,7 +140,8 @@ def get_api_answer(timestamp):
     params = {
         'url': ENDPOINT,
         'headers': HEADERS,
-        'params': timestamp
+        'params': timestamp,
+        'timeout': REQUEST_TIMEOUT,
     }
     try:
         response = requests.get(**params)
@@ -116,6 +150,13 @@ def get_api_answer(timestamp):
             f'Ошибка запроса к {ENDPOINT}. '
             f'Параметры: {params}. Ошибка: {error}'
         )
+    if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+        retry_after = response.headers.get('Retry-After', '')
+        raise TooManyRequestsError(
+            f'Превышен лимит запросов к {ENDPOINT}. '
+            f'Retry-After: {retry_after}',
+            int(retry_after) if retry_after.isdigit() else RETRY_PERIOD
+        )
     if response.status_code != HTTPStatus.OK:
         raise APIResponseError(
             f'Эндпоинт {ENDPOINT} недоступен. Код ответа API: '
@@ -131,6 +172,23 @@ def get_api_answer(timestamp):
         )
 
 
+def check_homework(homework):
+    """
+    Checks a single homework from the API response.
+    The homework must be a dictionary containing every key listed in
+    HOMEWORK_KEYS. Other keys are allowed, so new fields in the API do not
+    break the bot.
+    """
+    if not isinstance(homework, dict):
+        raise TypeError(
+            'Домашняя работа не является словарём. '
+            f'Получен тип {type(homework)}'
+        )
+    for key in HOMEWORK_KEYS:
+        if key not in homework:
+            raise KeyError(f'В объекте домашней работы нет ключа {key}')
+
+
 def check_response(response):
     """
     Checks the API response for compliance with the documentation.
@@ -154,16 +212,8 @@ def check_response(response):
             'Значение ключа "homeworks" не является типом list'
             f'Значение ключа "homeworks": {type(response["homeworks"])}'
         )
-    if not isinstance(response['homeworks'][0], dict):
-        raise TypeError(
-            'Домашняя работа не является словарём.'
-            f'Получен тип {type(response["homeworks"][0])}'
-        )
-    for key in response['homeworks'][0]:
-        if key not in HOMEWORK_KEYS:
-            raise KeyError(
-                f'В объекте домашней работы нет ключа {key}'
-            )
+    for homework in response['homeworks']:
+        check_homework(homework)
 
 
 def parse_status(homework):
@@ -174,22 +224,173 @@ def parse_status(homework):
     sending to Telegram containing one of the verdicts of the HOMEWORK_VERDICTS
     dictionary.
     """
-    try:
-        homework_name = homework['homework_name']
-    except KeyError:
+    homework_name = homework.get('homework_name')
+    if homework_name is None:
         raise KeyError('В ответе API нет ключа "homework_name"')
-    status = homework['status']
-    if status not in HOMEWORK_VERDICTS:
+    status = homework.get('status')
+    if status is None:
+        raise KeyError('В ответе API нет ключа "status"')
+    template = STATUS_TEMPLATES.get(status)
+    if template is None:
         raise ValueError(
             'Значение ключа "status" не соответствует ожиданиям'
         )
-    verdict = HOMEWORK_VERDICTS[status]
+    return template % homework_name
+
+
+def load_state():
+    """
+    Loads the dates of already reported homework updates.
+    The state is read from STATE_FILE, homework_state.json in the working
+    directory by default. If STATE_FILE is set to an empty value or the
+    file cannot be read, the bot starts with an empty state.
+    """
+    if not STATE_FILE:
+        return {}
+    try:
+        with open(STATE_FILE, encoding='utf-8') as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        logger.warning(
+            'Не удалось прочитать состояние из %s: %s', STATE_FILE, error
+        )
+        return {}
+    if not isinstance(state, dict):
+        logger.warning(
+            'Состояние в %s не является словарём и не будет использовано',
+            STATE_FILE
+        )
+        return {}
+    return state
+
+
+def save_state(seen_updates):
+    """
+    Saves the dates of reported homework updates to STATE_FILE.
+    The state is written to a temporary file that then replaces the old
+    one, so an interrupted write never leaves a damaged file behind. A
+    failed write is only logged, since the messages are already sent.
+    """
+    if not STATE_FILE:
+        return
+    temp_file = f'{STATE_FILE}.tmp'
+    try:
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump(seen_updates, file)
+        os.replace(temp_file, STATE_FILE)
+    except OSError as error:
+        logger.warning(
+            'Не удалось сохранить состояние в %s: %s', STATE_FILE, error
+        )
+
 
-    return f'Изменился статус проверки работы "{homework_name}". {verdict}'
+def split_messages(messages):
+    """
+    Splits messages into batches that fit into one Telegram message.
+    Joined by an empty line, each batch is at most MESSAGE_MAX_LENGTH
+    characters long unless a single message alone is longer.
+    """
+    batch = []
+    length = 0
+    for message in messages:
+        if batch and length + len(message) + 2 > MESSAGE_MAX_LENGTH:
+            yield batch
+            batch = []
+        length = len(message) + (length + 2 if batch else 0)
+        batch.append(message)
+    if batch:
+        yield batch
+
+
+def get_update(homework):
+    """
+    Returns the key of the homework and the marker of its last update.
+    The API documents id and date_updated; if either is missing, the
+    homework name and status are used instead.
+    """
+    return (
+        str(homework.get('id', homework['homework_name'])),
+        homework.get('date_updated', homework['status']),
+    )
+
+
+def send_updates(bot, homeworks, seen_updates, recent_errors):
+    """
+    Sends the statuses of updated homeworks to the Telegram chat.
+    A homework is considered updated if its update marker differs from the
+    one stored in seen_updates under its key. Homeworks whose status cannot
+    be parsed are reported and skipped. The rest are batched into as few
+    messages as possible, and seen_updates is refreshed and saved after
+    each message is sent. Returns True if there was anything to send.
+    """
+    updates = []
+    for homework in homeworks:
+        homework_key, date_updated = get_update(homework)
+        if seen_updates.get(homework_key) == date_updated:
+            continue
+        try:
+            message = parse_status(homework)
+        except (KeyError, ValueError) as error:
+            report_error(bot, error, recent_errors)
+            continue
+        updates.append((homework_key, date_updated, message))
+    batches = split_messages(message for *_, message in updates)
+    sent = 0
+    for batch in batches:
+        if sent:
+            time.sleep(MESSAGE_INTERVAL)
+        send_message(bot, '\n\n'.join(batch))
+        for homework_key, date_updated, _ in updates[sent:sent + len(batch)]:
+            seen_updates[homework_key] = date_updated
+        sent += len(batch)
+        save_state(seen_updates)
+    return bool(updates)
+
+
+def is_api_outage(has_response, first_failure_time):
+    """
+    Checks whether a failed API request can be treated as a short outage.
+    Connection problems and unexpected response codes are tolerated for
+    MAX_STALE_PERIOD seconds counted from the first failed request, which
+    covers scheduled maintenance of the service without notifying the chat.
+    Nothing is tolerated until the API has answered successfully once.
+    """
+    if not has_response:
+        return False
+    return time.monotonic() - first_failure_time < MAX_STALE_PERIOD
+
+
+def report_error(bot, error, recent_errors):
+    """
+    Logs the error and reports it to the Telegram chat.
+    The same error is reported at most once per ERROR_TTL seconds, even if
+    it alternates with other errors. recent_errors maps error keys to the
+    time of their last report and is updated in place. If the report cannot
+    be delivered, it is only logged and retried on the next error.
+    """
+    message = f'Сбой в работе программы: {error}'
+    logger.error(message, exc_info=True)
+    key = f'{type(error).__name__}:{str(error)[:60]}'
+    now = time.monotonic()
+    reported_at = recent_errors.get(key)
+    if reported_at is not None and now - reported_at < ERROR_TTL:
+        return
+    try:
+        send_message(bot, message)
+    except TelegramError as send_error:
+        logger.error(send_error, exc_info=True)
+        return
+    recent_errors[key] = now
+    recent_errors.move_to_end(key)
+    if len(recent_errors) > MAX_RECENT_ERRORS:
+        recent_errors.popitem(last=False)
 
 
 def main():
     """Основная логика работы бота."""
+    setup_logging()
     try:
         check_tokens()
     except MissingTokenError as error:
@@ -197,33 +398,44 @@ def main():
         raise sys.exit()
 
     bot = TeleBot(token=TELEGRAM_TOKEN)
-    previous_date_updated = None
-    last_error = None
+    seen_updates = load_state()
+    recent_errors = OrderedDict()
+    payload = {
+        'from_date': int((datetime.now() - timedelta(days=DAYS)).timestamp())
+    }
+    has_response = False
+    first_failure_time = None
 
     while True:
+        retry_period = RETRY_PERIOD
         try:
-            response = get_api_answer(PAYLOAD)
+            response = get_api_answer(payload)
             check_response(response)
-            if len(response['homeworks']) == 0:
-                logging.debug('Нет новых данных о проектах.')
-                previous_date_updated = None
-                last_error = None
-            homework = response['homeworks'][0]
-            date_updated = homework['date_updated']
-            message = parse_status(homework)
-            if date_updated != previous_date_updated:
-                send_message(bot, message)
-                previous_date_updated = date_updated
+            has_response = True
+            first_failure_time = None
+            homeworks = response['homeworks']
+            if homeworks:
+                send_updates(bot, homeworks, seen_updates, recent_errors)
+            else:
+                logger.debug('Нет новых данных о проектах.')
+            payload = {'from_date': response['current_date']}
+
+        except TooManyRequestsError as error:
+            logger.warning(error)
+            retry_period = max(error.retry_after, RETRY_PERIOD)
+
+        except (ConnectionError, APIResponseError) as error:
+            first_failure_time = first_failure_time or time.monotonic()
+            if is_api_outage(has_response, first_failure_time):
+                logger.warning('API временно недоступен: %s', error)
+            else:
+                report_error(bot, error, recent_errors)
 
         except Exception as error:
-            message = f'Сбой в работе программы: {error}'
-            logger.error(message, exc_info=True)
-            if message != last_error:
-                send_message(bot, message)
-                last_error = message
+            report_error(bot, error, recent_errors)
 
         finally:
-            time.sleep(RETRY_PERIOD)
+            time.sleep(retry_period)
 
 
 if __name__ == '__main__':
@@ -116,6 +116,14 @@ class MockTelegramBot:
         self.text = text
 
 
+class RecordingTelegramBot:
+    def __init__(self, *args, **kwargs):
+        self.messages = []
+
+    def send_message(self, chat_id=None, text=None, **kwargs):
+        self.messages.append(text)
+
+
 class BreakInfiniteLoop(BaseException):
     pass
 
@@ -1,8 +1,11 @@
+import importlib
 import inspect
 import logging
 import platform
 import re
 import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from http import HTTPStatus
 
 import pytest
@@ -36,6 +39,70 @@ def get_mock_telegram_bot(monkeypatch, random_message):
     return telebot.TeleBot(token='')
 
 
+def create_api_response(homeworks=(), http_status=HTTPStatus.OK,
+                        headers=None, current_date=1000198000):
+    response = check_utils.MockResponseGET(
+        http_status=http_status,
+        data={'homeworks': list(homeworks), 'current_date': current_date}
+    )
+    response.headers = headers or {}
+    return response
+
+
+def create_homework(homework_id=1, date_updated='2021-04-11T10:31:09Z',
+                    status='approved'):
+    return {
+        'id': homework_id,
+        'homework_name': f'hw{homework_id}.zip',
+        'status': status,
+        'date_updated': date_updated,
+    }
+
+
+def run_main_polls(monkeypatch, homework_module, responses, bot=None):
+    """
+    Run main() for one poll per item of `responses` on a fake clock.
+
+    Items are returned from the mocked `requests.get`, or raised if they
+    are exceptions. Return the pauses made by main(), the bot it used and
+    the `params` of every request.
+    """
+    responses = list(responses)
+    monkeypatch.setattr(homework_module, 'PRACTICUM_TOKEN', 'sometoken')
+    monkeypatch.setattr(homework_module, 'TELEGRAM_TOKEN', '1234:abcdefg')
+    monkeypatch.setattr(homework_module, 'TELEGRAM_CHAT_ID', '12345')
+    monkeypatch.setattr(homework_module, 'STATE_FILE', None)
+    bot = bot or check_utils.RecordingTelegramBot()
+    monkeypatch.setattr(homework_module, 'TeleBot', lambda token: bot)
+
+    pending = iter(responses)
+    clock = [1000.0]
+    pauses = []
+    params = []
+
+    def mock_get(*args, **kwargs):
+        params.append(dict(kwargs['params']))
+        response = next(pending)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def mock_sleep(secs):
+        pauses.append(secs)
+        clock[0] += secs
+        if len(pauses) == len(responses):
+            raise check_utils.BreakInfiniteLoop('break')
+
+    monkeypatch.setattr(requests, 'get', mock_get)
+    monkeypatch.setattr(time, 'sleep', mock_sleep)
+    monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+    try:
+        homework_module.main()
+    except check_utils.BreakInfiniteLoop:
+        pass
+    return pauses, bot, params
+
+
 class TestHomework:
     HOMEWORK_VERDICTS = {
         'approved': 'Работа проверена: ревьюеру всё понравилось. Ура!',
@@ -825,3 +892,429 @@ class TestHomework:
     def test_docstrings(self, homework_module):
         for func in self.HOMEWORK_FUNC_WITH_PARAMS_QTY:
             check_utils.check_docstring(homework_module, func)
+
+    def test_main_poll_interval(self, monkeypatch, homework_module):
+        homework = create_homework()
+        pauses, bot, _ = run_main_polls(monkeypatch, homework_module, [
+            *[create_api_response() for _ in range(5)],
+            create_api_response([homework]),
+            create_api_response([homework]),
+            create_api_response(
+                http_status=HTTPStatus.TOO_MANY_REQUESTS,
+                headers={'Retry-After': '1800'}
+            ),
+            create_api_response(
+                http_status=HTTPStatus.TOO_MANY_REQUESTS,
+                headers={'Retry-After': '30'}
+            ),
+        ])
+        assert pauses == [600] * 7 + [1800, 600], (
+            'Убедитесь, что запросы к API отправляются раз в `RETRY_PERIOD`, '
+            'а при ответе 429 бот ждёт не меньше, чем указано в заголовке '
+            '`Retry-After`.'
+        )
+        assert len(bot.messages) == 1
+
+    @pytest.mark.parametrize('failures, expected_messages', [(6, 0), (7, 1)])
+    def test_main_tolerates_short_api_outage(
+            self, monkeypatch, homework_module, failures, expected_messages
+    ):
+        outage = requests.ConnectionError('outage')
+        pauses, bot, _ = run_main_polls(monkeypatch, homework_module, [
+            *[create_api_response() for _ in range(5)],
+            *[outage for _ in range(failures)],
+        ])
+        assert len(bot.messages) == expected_messages, (
+            'Убедитесь, что о недоступности API бот сообщает, только если '
+            'сбой длится дольше `MAX_STALE_PERIOD` с первого неудачного '
+            'запроса.'
+        )
+
+    def test_main_reports_api_error_before_first_response(
+            self, monkeypatch, homework_module
+    ):
+        pauses, bot, _ = run_main_polls(monkeypatch, homework_module, [
+            requests.ConnectionError('outage'),
+        ])
+        assert len(bot.messages) == 1, (
+            'Убедитесь, что ошибка API до первого успешного ответа '
+            'сразу отправляется в Telegram.'
+        )
+
+    def test_is_api_outage(self, monkeypatch, homework_module):
+        monkeypatch.setattr(time, 'monotonic', lambda: 5000.0)
+        assert homework_module.is_api_outage(True, 2000.0)
+        assert not homework_module.is_api_outage(True, 1400.0)
+        assert not homework_module.is_api_outage(False, 5000.0)
+
+    def test_main_outage_clock_ignores_other_errors(
+            self, monkeypatch, homework_module
+    ):
+        invalid_response = check_utils.MockResponseGET(
+            data={'current_date': 1000198000}
+        )
+        invalid_response.headers = {}
+        outage = requests.ConnectionError('outage')
+        pauses, bot, _ = run_main_polls(monkeypatch, homework_module, [
+            create_api_response(),
+            *[invalid_response for _ in range(6)],
+            outage,
+        ])
+        assert len(bot.messages) == 1, (
+            'Убедитесь, что ошибки, не связанные с доступностью API, не '
+            'запускают отсчёт `MAX_STALE_PERIOD`.'
+        )
+        assert 'homeworks' in bot.messages[0]
+
+    def test_check_response_homework_keys(self, homework_module):
+        homework = create_homework()
+        homework['new_api_field'] = 'value'
+        homework_module.check_response(
+            {'homeworks': [homework], 'current_date': 1000198000}
+        )
+        for key in ('homework_name', 'status'):
+            invalid_homework = create_homework(homework_id=2)
+            del invalid_homework[key]
+            try:
+                homework_module.check_response({
+                    'homeworks': [create_homework(), invalid_homework],
+                    'current_date': 1000198000
+                })
+            except KeyError as e:
+                assert repr(e) != f"KeyError('{key}')", (
+                    'Убедитесь, что функция `check_response` выбрасывает '
+                    'исключение с понятным текстом ошибки, если в домашней '
+                    f'работе нет ключа `{key}`.'
+                )
+            else:
+                raise AssertionError(
+                    'Убедитесь, что функция `check_response` проверяет '
+                    f'наличие ключа `{key}` в каждой домашней работе.'
+                )
+
+    def test_split_messages(self, homework_module):
+        max_length = homework_module.MESSAGE_MAX_LENGTH
+        messages = ['a' * 3000, 'b' * 1000, 'c' * 100, 'd']
+        batches = list(homework_module.split_messages(messages))
+        assert batches == [['a' * 3000, 'b' * 1000], ['c' * 100, 'd']], (
+            'Убедитесь, что сообщения объединяются в части не длиннее '
+            f'{max_length} символов.'
+        )
+        assert all(len('\n\n'.join(batch)) <= max_length for batch in batches)
+        assert list(homework_module.split_messages([])) == []
+
+    def test_send_updates(self, monkeypatch, homework_module):
+        monkeypatch.setattr(homework_module, 'STATE_FILE', None)
+        bot = check_utils.RecordingTelegramBot()
+        seen_updates = {}
+        homeworks = [create_homework(1), create_homework(2)]
+        assert homework_module.send_updates(
+            bot, homeworks, seen_updates, OrderedDict()
+        )
+        assert len(bot.messages) == 1, (
+            'Убедитесь, что изменения нескольких домашних работ '
+            'отправляются одним сообщением.'
+        )
+        assert not homework_module.send_updates(
+            bot, homeworks, seen_updates, OrderedDict()
+        )
+        assert len(bot.messages) == 1, (
+            'Убедитесь, что бот не отправляет повторно уже известные '
+            'изменения статуса.'
+        )
+        homeworks[1] = create_homework(2, date_updated='2021-04-12T10:00:00Z')
+        assert homework_module.send_updates(
+            bot, homeworks, seen_updates, OrderedDict()
+        )
+        assert bot.messages[-1].count('Изменился статус') == 1
+
+    def test_send_updates_resends_after_failure(
+            self, monkeypatch, homework_module
+    ):
+        monkeypatch.setattr(homework_module, 'STATE_FILE', None)
+
+        class FailingBot(check_utils.RecordingTelegramBot):
+            def send_message(self, *args, **kwargs):
+                raise telebot.apihelper.ApiException(
+                    'Ошибка Telegram.', 'send_message', 500
+                )
+
+        seen_updates = {}
+        homeworks = [create_homework()]
+        with pytest.raises(homework_module.TelegramError):
+            homework_module.send_updates(
+                FailingBot(), homeworks, seen_updates, OrderedDict()
+            )
+        assert seen_updates == {}, (
+            'Убедитесь, что при сбое отправки изменение статуса не '
+            'запоминается и будет отправлено при следующем запросе.'
+        )
+        bot = check_utils.RecordingTelegramBot()
+        assert homework_module.send_updates(
+            bot, homeworks, seen_updates, OrderedDict()
+        )
+        assert len(bot.messages) == 1
+
+    def test_send_updates_without_id_and_date(
+            self, monkeypatch, homework_module
+    ):
+        monkeypatch.setattr(homework_module, 'STATE_FILE', None)
+        bot = check_utils.RecordingTelegramBot()
+        seen_updates = {}
+        homeworks = [{'homework_name': 'hw123', 'status': 'reviewing'}]
+        assert homework_module.send_updates(
+            bot, homeworks, seen_updates, OrderedDict()
+        )
+        assert not homework_module.send_updates(
+            bot, homeworks, seen_updates, OrderedDict()
+        )
+        homeworks[0]['status'] = 'approved'
+        assert homework_module.send_updates(
+            bot, homeworks, seen_updates, OrderedDict()
+        ), (
+            'Убедитесь, что бот отслеживает изменения домашней работы, '
+            'в которой нет ключей `id` и `date_updated`.'
+        )
+
+    def test_send_updates_skips_unknown_status(
+            self, monkeypatch, homework_module
+    ):
+        monkeypatch.setattr(homework_module, 'STATE_FILE', None)
+        bot = check_utils.RecordingTelegramBot()
+        seen_updates = {}
+        homeworks = [create_homework(1, status='unknown'), create_homework(2)]
+        assert homework_module.send_updates(
+            bot, homeworks, seen_updates, OrderedDict()
+        )
+        assert len(bot.messages) == 2
+        assert 'hw2.zip' in bot.messages[1], (
+            'Убедитесь, что домашняя работа с неизвестным статусом не '
+            'мешает отправке изменений остальных работ.'
+        )
+        assert list(seen_updates) == ['2']
+
+    def test_send_updates_records_sent_batches(
+            self, monkeypatch, homework_module
+    ):
+        monkeypatch.setattr(homework_module, 'STATE_FILE', None)
+        monkeypatch.setattr(homework_module, 'MESSAGE_MAX_LENGTH', 100)
+        monkeypatch.setattr(time, 'sleep', lambda secs: None)
+
+        class FailingSecondSendBot(check_utils.RecordingTelegramBot):
+            def send_message(self, *args, **kwargs):
+                if self.messages:
+                    raise telebot.apihelper.ApiException(
+                        'Ошибка Telegram.', 'send_message', 500
+                    )
+                super().send_message(*args, **kwargs)
+
+        seen_updates = {}
+        homeworks = [create_homework(1), create_homework(2)]
+        with pytest.raises(homework_module.TelegramError):
+            homework_module.send_updates(
+                FailingSecondSendBot(), homeworks, seen_updates, OrderedDict()
+            )
+        assert list(seen_updates) == ['1'], (
+            'Убедитесь, что изменения из уже отправленных сообщений '
+            'запоминаются, даже если следующее сообщение не отправилось.'
+        )
+
+    def test_state_round_trip(self, monkeypatch, tmp_path, homework_module):
+        state_file = tmp_path / 'state.json'
+        monkeypatch.setattr(homework_module, 'STATE_FILE', str(state_file))
+        assert homework_module.load_state() == {}
+        bot = check_utils.RecordingTelegramBot()
+        homeworks = [create_homework(777)]
+        homework_module.send_updates(bot, homeworks, {}, OrderedDict())
+        seen_updates = homework_module.load_state()
+        assert seen_updates == {'777': homeworks[0]['date_updated']}
+        sent = homework_module.send_updates(
+            bot, homeworks, seen_updates, OrderedDict()
+        )
+        assert not sent, (
+            'Убедитесь, что после перезапуска бот не отправляет повторно '
+            'изменения, сохранённые в `STATE_FILE`.'
+        )
+        assert len(bot.messages) == 1
+
+    @pytest.mark.parametrize('content', ['[1, 2]', '"state"', '{broken'])
+    def test_load_state_with_invalid_file(
+            self, monkeypatch, tmp_path, content, homework_module
+    ):
+        state_file = tmp_path / 'state.json'
+        state_file.write_text(content, encoding='utf-8')
+        monkeypatch.setattr(homework_module, 'STATE_FILE', str(state_file))
+        assert homework_module.load_state() == {}, (
+            'Убедитесь, что при повреждённом файле состояния бот начинает '
+            'работу с пустым состоянием.'
+        )
+
+    def test_save_state_to_unwritable_path(
+            self, monkeypatch, tmp_path, homework_module
+    ):
+        state_file = tmp_path / 'missing_dir' / 'state.json'
+        monkeypatch.setattr(homework_module, 'STATE_FILE', str(state_file))
+        bot = check_utils.RecordingTelegramBot()
+        assert homework_module.send_updates(
+            bot, [create_homework()], {}, OrderedDict()
+        ), (
+            'Убедитесь, что ошибка записи `STATE_FILE` не прерывает '
+            'обработку отправленных изменений.'
+        )
+
+    def test_state_file_default(self, monkeypatch, homework_module):
+        monkeypatch.delenv('STATE_FILE')
+        try:
+            importlib.reload(homework_module)
+            assert homework_module.STATE_FILE == 'homework_state.json', (
+                'Убедитесь, что по умолчанию состояние сохраняется в файл '
+                '`homework_state.json` в рабочей директории.'
+            )
+        finally:
+            monkeypatch.undo()
+            importlib.reload(homework_module)
+        assert homework_module.STATE_FILE == ''
+
+    def test_report_error_deduplicates_alternating_errors(
+            self, monkeypatch, homework_module
+    ):
+        clock = [1000.0]
+        monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+        bot = check_utils.RecordingTelegramBot()
+        recent_errors = OrderedDict()
+        errors = [ValueError('first'), KeyError('second')]
+        for error in errors * 3:
+            homework_module.report_error(bot, error, recent_errors)
+        assert len(bot.messages) == 2, (
+            'Убедитесь, что о чередующихся ошибках бот сообщает только '
+            'один раз в течение `ERROR_TTL`.'
+        )
+        clock[0] += homework_module.ERROR_TTL
+        homework_module.report_error(bot, errors[0], recent_errors)
+        assert len(bot.messages) == 3, (
+            'Убедитесь, что по истечении `ERROR_TTL` бот снова сообщает '
+            'о повторившейся ошибке.'
+        )
+
+    def test_report_error_limits_remembered_errors(
+            self, monkeypatch, homework_module
+    ):
+        monkeypatch.setattr(time, 'monotonic', lambda: 1000.0)
+        bot = check_utils.RecordingTelegramBot()
+        recent_errors = OrderedDict()
+        max_errors = homework_module.MAX_RECENT_ERRORS
+        for index in range(max_errors + 1):
+            homework_module.report_error(
+                bot, ValueError(f'error {index}'), recent_errors
+            )
+        assert len(recent_errors) == max_errors
+        assert 'ValueError:error 0' not in recent_errors
+        assert f'ValueError:error {max_errors}' in recent_errors
+
+    @pytest.mark.parametrize('retry_after, expected', [
+        ('1800', 1800), ('Wed, 21 Oct 2015 07:28:00 GMT', 600), (None, 600)
+    ])
+    def test_get_api_answer_too_many_requests(
+            self, monkeypatch, current_timestamp, retry_after, expected,
+            homework_module
+    ):
+        headers = {'Retry-After': retry_after} if retry_after else {}
+        monkeypatch.setattr(requests, 'get', lambda *args, **kwargs: (
+            create_api_response(
+                http_status=HTTPStatus.TOO_MANY_REQUESTS, headers=headers
+            )
+        ))
+        with pytest.raises(homework_module.TooManyRequestsError) as error:
+            homework_module.get_api_answer(current_timestamp)
+        assert error.value.retry_after == expected, (
+            'Убедитесь, что при ответе 429 функция `get_api_answer` '
+            'передаёт задержку из заголовка `Retry-After`.'
+        )
+
+    def test_send_message_waits_for_telegram_flood_control(
+            self, monkeypatch, homework_module
+    ):
+        monkeypatch.setattr(homework_module, 'TELEGRAM_CHAT_ID', '12345')
+        pauses = []
+        monkeypatch.setattr(time, 'sleep', pauses.append)
+
+        class FloodControlBot(check_utils.RecordingTelegramBot):
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                if not pauses:
+                    raise telebot.apihelper.ApiTelegramException(
+                        'send_message', None, {
+                            'error_code': 429,
+                            'description': 'Too Many Requests',
+                            'parameters': {'retry_after': 7},
+                        }
+                    )
+                super().send_message(chat_id, text, **kwargs)
+
+        bot = FloodControlBot()
+        homework_module.send_message(bot, 'Test_message_check')
+        assert pauses == [7] and bot.messages == ['Test_message_check'], (
+            'Убедитесь, что при ответе Telegram 429 сообщение отправляется '
+            'повторно после задержки `retry_after`.'
+        )
+
+    def test_send_updates_pauses_between_chunks(
+            self, monkeypatch, homework_module
+    ):
+        monkeypatch.setattr(homework_module, 'STATE_FILE', None)
+        monkeypatch.setattr(homework_module, 'MESSAGE_MAX_LENGTH', 100)
+        pauses = []
+        monkeypatch.setattr(time, 'sleep', pauses.append)
+        bot = check_utils.RecordingTelegramBot()
+        homeworks = [create_homework(homework_id) for homework_id in (1, 2)]
+        homework_module.send_updates(bot, homeworks, {}, OrderedDict())
+        assert len(bot.messages) == 2
+        assert pauses == [homework_module.MESSAGE_INTERVAL]
+
+    def test_main_advances_from_date(self, monkeypatch, homework_module):
+        start = int(
+            (datetime.now() - timedelta(days=homework_module.DAYS))
+            .timestamp()
+        )
+        _, _, params = run_main_polls(monkeypatch, homework_module, [
+            create_api_response(current_date=111),
+            requests.ConnectionError('outage'),
+            create_api_response(current_date=222),
+            create_api_response(current_date=333),
+        ])
+        from_dates = [request_params['from_date'] for request_params in params]
+        assert abs(from_dates[0] - start) <= 5, (
+            'Убедитесь, что первый запрос к API охватывает последние '
+            '`DAYS` дней.'
+        )
+        assert from_dates[1:] == [111, 111, 222], (
+            'Убедитесь, что в следующем запросе `from_date` берётся из '
+            '`current_date` предыдущего успешного ответа и не меняется '
+            'после неудачного запроса.'
+        )
+
+    def test_main_keeps_polling_when_telegram_fails(
+            self, monkeypatch, homework_module
+    ):
+        class FailingBot(check_utils.RecordingTelegramBot):
+            def send_message(self, *args, **kwargs):
+                self.messages.append(kwargs.get('text'))
+                raise telebot.apihelper.ApiException(
+                    'Ошибка Telegram.', 'send_message', 500
+                )
+
+        responses = [
+            requests.ConnectionError('outage'),
+            requests.ConnectionError('outage'),
+            create_api_response([create_homework()]),
+        ]
+        pauses, bot, _ = run_main_polls(
+            monkeypatch, homework_module, responses, bot=FailingBot()
+        )
+        assert len(pauses) == len(responses), (
+            'Убедитесь, что бот продолжает работу, если Telegram '
+            'недоступен при отправке сообщения об ошибке.'
+        )
+        assert len(bot.messages) == 4, (
+            'Убедитесь, что неотправленное сообщение об ошибке '
+            'отправляется повторно при следующем сбое.'
+        )